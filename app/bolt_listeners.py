@@ -1,11 +1,13 @@
 import logging
 import re
 import time
+from functools import lru_cache
+from typing import List, Optional
 
 from litellm import Timeout
-from slack_bolt import Ack, App, BoltContext, BoltResponse
+from slack_bolt import Ack, App, BoltContext, BoltRequest, BoltResponse
 from slack_bolt.request.payload_utils import is_event
-from slack_sdk.web import WebClient
+from slack_sdk.web import SlackResponse, WebClient
 
 from app.env import (
     IMAGE_FILE_ACCESS_ENABLED,
@@ -15,10 +17,15 @@ from app.env import (
     TRANSLATE_MARKDOWN,
 )
 from app.i18n import translate
-from app.litellm_image_ops import append_image_content_if_exists
+from app.litellm_image_ops import (
+    append_image_content_if_exists,
+    collect_image_contents,
+    start_building_image_contents,
+)
 from app.litellm_ops import (
     build_system_text,
     consume_litellm_stream_to_write_reply,
+    count_latest_texts_within_context_window,
     format_litellm_message_content,
     messages_within_context_window,
     start_receiving_litellm_response,
@@ -27,11 +34,16 @@ from app.sensitive_info_redaction import redact_string
 from app.slack_constants import DEFAULT_LOADING_TEXT, TIMEOUT_ERROR_MESSAGE
 from app.slack_ops import (
     can_send_image_url_to_litellm,
+    fetch_thread_replies_page,
+    find_dm_history,
     find_parent_message,
+    find_thread_replies,
     is_this_app_mentioned,
     post_wip_message,
+    slack_io_executor,
     update_wip_message,
 )
+from app.ttl_cache import TTLCache
 
 #
 # Listener functions
@@ -42,6 +54,47 @@ def just_ack(ack: Ack):
     ack()
 
 
+# Compiled once per bot user, to strip the mention from the initial message
+@lru_cache(maxsize=512)
+def _mention_pattern(bot_user_id: str) -> re.Pattern:
+    return re.compile(f"<@{re.escape(bot_user_id)}>\\s*")
+
+
+# The text of a reply as it is sent to the LLM
+def _format_reply_text(reply_user: Optional[str], text: Optional[str]) -> str:
+    return f"<@{reply_user}>: " + format_litellm_message_content(
+        redact_string(text), TRANSLATE_MARKDOWN
+    )
+
+
+# Returns the files to download for each reply, given the texts sent for them.
+# Replies too old to fit in the context window are trimmed anyway, so skip their images.
+def _files_worth_downloading(
+    context: BoltContext, replies: List[dict], reply_texts: List[str]
+) -> List[Optional[List[dict]]]:
+    if not can_send_image_url_to_litellm(context) or not any(
+        reply.get("files") for reply in replies
+    ):
+        return [None] * len(replies)
+    first_idx = len(replies) - count_latest_texts_within_context_window(reply_texts)
+    return [
+        (
+            reply.get("files")
+            if idx >= first_idx and reply.get("bot_id") is None
+            else None
+        )
+        for idx, reply in enumerate(replies)
+    ]
+
+
+# Appends an error message to the text of the loading message, if any
+def _append_error_text(wip_reply: Optional[SlackResponse], error_text: str) -> str:
+    wip_text = (
+        wip_reply.get("message", {}).get("text", "") if wip_reply is not None else ""
+    )
+    return "\n\n".join((wip_text, error_text))
+
+
 #
 # Chat with the bot
 #
@@ -54,8 +107,19 @@ def respond_to_app_mention(
     logger: logging.Logger,
 ):
     thread_ts = payload.get("thread_ts")
+    ts = payload["ts"]
+    channel_id = context.channel_id
+    bot_user_id = context.bot_user_id
+    bot_token = context.bot_token
+    first_page = None
     if thread_ts is not None:
-        parent_message = find_parent_message(client, context.channel_id, thread_ts)
+        # The first page of the thread starts with its parent message
+        first_page = fetch_thread_replies_page(client, channel_id, thread_ts)
+        first_replies = first_page.get("messages", [])
+        if first_replies and first_replies[0].get("ts") == thread_ts:
+            parent_message = first_replies[0]
+        else:
+            parent_message = find_parent_message(client, channel_id, thread_ts)
         if parent_message is not None and is_this_app_mentioned(
             context, parent_message
         ):
@@ -69,36 +133,58 @@ def respond_to_app_mention(
 
     try:
         user_id = context.actor_user_id or context.user_id
-        if thread_ts is not None:
+        # Fetch the rest of the thread while posting the loading message
+        replies_future = (
+            slack_io_executor.submit(
+                find_thread_replies,
+                client,
+                channel_id,
+                thread_ts,
+                ts,
+                first_page=first_page,
+            )
+            if first_page is not None
+            else None
+        )
+        loading_text = translate(context=context, text=DEFAULT_LOADING_TEXT)
+        wip_reply = post_wip_message(
+            client=client,
+            channel=channel_id,
+            thread_ts=ts,
+            loading_text=loading_text,
+            messages=messages,
+            user=context.user_id,
+        )
+
+        if replies_future is not None:
             # Mentioning the bot user in a thread
-            replies_in_thread = client.conversations_replies(
-                channel=context.channel_id,
-                ts=thread_ts,
-                include_all_metadata=True,
-                limit=1000,
-            ).get("messages", [])
-            for reply in replies_in_thread:
-                reply_text = redact_string(reply.get("text"))
-                message_text_item = {
-                    "type": "text",
-                    "text": f"<@{reply['user'] if 'user' in reply else reply['username']}>: "
-                    + format_litellm_message_content(reply_text, TRANSLATE_MARKDOWN),
-                }
-                content = [message_text_item]
-
-                if reply.get("bot_id") is None and can_send_image_url_to_litellm(
-                    context
-                ):
-                    append_image_content_if_exists(
-                        bot_token=context.bot_token,
-                        files=reply.get("files"),
-                        content=content,
-                        logger=context.logger,
-                    )
+            replies_in_thread = replies_future.result()
+            reply_texts = [
+                _format_reply_text(
+                    reply.get("user") or reply.get("username"), reply.get("text")
+                )
+                for reply in replies_in_thread
+            ]
+            image_content_futures = start_building_image_contents(
+                bot_token=bot_token,
+                files_per_message=_files_worth_downloading(
+                    context, replies_in_thread, reply_texts
+                ),
+                logger=context.logger,
+            )
+            for reply, reply_text, image_content in zip(
+                replies_in_thread,
+                reply_texts,
+                collect_image_contents(image_content_futures),
+            ):
+                content = [{"type": "text", "text": reply_text}]
+
+                if image_content is not None:
+                    content += image_content
 
                 role = (
                     "assistant"
-                    if "user" in reply and reply["user"] == context.bot_user_id
+                    if "user" in reply and reply["user"] == bot_user_id
                     else "user"
                 )
                 messages.append(
@@ -109,7 +195,7 @@ def respond_to_app_mention(
                 )
         else:
             # Strip bot Slack user ID from initial message
-            msg_text = re.sub(f"<@{context.bot_user_id}>\\s*", "", payload["text"])
+            msg_text = _mention_pattern(bot_user_id).sub("", payload["text"])
             msg_text = redact_string(msg_text)
             message_text_item = {
                 "type": "text",
@@ -120,7 +206,7 @@ def respond_to_app_mention(
 
             if payload.get("bot_id") is None and can_send_image_url_to_litellm(context):
                 append_image_content_if_exists(
-                    bot_token=context.bot_token,
+                    bot_token=bot_token,
                     files=payload.get("files"),
                     content=content,
                     logger=context.logger,
@@ -128,26 +214,15 @@ def respond_to_app_mention(
 
             messages.append({"role": "user", "content": content})
 
-        loading_text = translate(context=context, text=DEFAULT_LOADING_TEXT)
-        wip_reply = post_wip_message(
-            client=client,
-            channel=context.channel_id,
-            thread_ts=payload["ts"],
-            loading_text=loading_text,
-            messages=messages,
-            user=context.user_id,
-        )
-
         (
             messages,
             num_context_tokens,
             max_context_tokens,
         ) = messages_within_context_window(messages)
-        num_messages = len([msg for msg in messages if msg.get("role") != "system"])
-        if num_messages == 0:
+        if not any(msg.get("role") != "system" for msg in messages):
             update_wip_message(
                 client=client,
-                channel=context.channel_id,
+                channel=channel_id,
                 ts=wip_reply["message"]["ts"],
                 text=f":warning: The previous message is too long ({num_context_tokens}/{max_context_tokens} prompt tokens).",
                 messages=messages,
@@ -172,40 +247,24 @@ def respond_to_app_mention(
 
     except (Timeout, TimeoutError):
         if wip_reply is not None:
-            text = (
-                (
-                    wip_reply.get("message", {}).get("text", "")
-                    if wip_reply is not None
-                    else ""
-                )
-                + "\n\n"
-                + translate(
-                    context=context,
-                    text=TIMEOUT_ERROR_MESSAGE,
-                )
+            text = _append_error_text(
+                wip_reply, translate(context=context, text=TIMEOUT_ERROR_MESSAGE)
             )
             client.chat_update(
-                channel=context.channel_id,
+                channel=channel_id,
                 ts=wip_reply["message"]["ts"],
                 text=text,
             )
     except Exception as e:
-        text = (
-            (
-                wip_reply.get("message", {}).get("text", "")
-                if wip_reply is not None
-                else ""
-            )
-            + "\n\n"
-            + translate(
-                context=context,
-                text=f":warning: Failed to start a conversation with AI: {e}",
-            )
+        # Translate only the fixed part so that the translation can be cached
+        warning = translate(
+            context=context, text=":warning: Failed to start a conversation with AI:"
         )
+        text = _append_error_text(wip_reply, f"{warning} {e}")
         logger.exception(text, e)
         if wip_reply is not None:
             client.chat_update(
-                channel=context.channel_id,
+                channel=channel_id,
                 ts=wip_reply["message"]["ts"],
                 text=text,
             )
@@ -217,7 +276,11 @@ def respond_to_new_message(
     client: WebClient,
     logger: logging.Logger,
 ):
-    if payload.get("bot_id") is not None and payload.get("bot_id") != context.bot_id:
+    bot_id = payload.get("bot_id")
+    channel_id = context.channel_id
+    bot_user_id = context.bot_user_id
+    bot_token = context.bot_token
+    if bot_id is not None and bot_id != context.bot_id:
         # Skip a new message by a different app
         return
 
@@ -226,32 +289,24 @@ def respond_to_new_message(
         is_in_dm_with_bot = payload.get("channel_type") == "im"
         is_thread_for_this_app = False
         thread_ts = payload.get("thread_ts")
+        ts = payload["ts"]
         if is_in_dm_with_bot is False and thread_ts is None:
             return
 
         messages_in_context = []
         if is_in_dm_with_bot is True and thread_ts is None:
             # In the DM with the bot; this is not within a thread
-            past_messages = client.conversations_history(
-                channel=context.channel_id,
-                include_all_metadata=True,
-                limit=100,
-            ).get("messages", [])
-            past_messages.reverse()
-            # Remove old messages
-            for message in past_messages:
-                seconds = time.time() - float(message.get("ts"))
-                if seconds < 86400:  # less than 1 day
-                    messages_in_context.append(message)
+            # Only the messages within a day are used; Slack leaves out the older ones
+            messages_in_context = find_dm_history(
+                client,
+                channel_id,
+                ts,
+                oldest=str(int(time.time()) - 86400),
+            )
             is_thread_for_this_app = True
         else:
             # Within a thread
-            messages_in_context = client.conversations_replies(
-                channel=context.channel_id,
-                ts=thread_ts,
-                include_all_metadata=True,
-                limit=1000,
-            ).get("messages", [])
+            messages_in_context = find_thread_replies(client, channel_id, thread_ts, ts)
             if is_in_dm_with_bot is True:
                 # In the DM with this bot
                 is_thread_for_this_app = True
@@ -264,9 +319,7 @@ def respond_to_new_message(
                         is_thread_for_this_app = is_this_app_mentioned(context, message)
                         break
                 if the_parent_message_found is False:
-                    parent_message = find_parent_message(
-                        client, context.channel_id, thread_ts
-                    )
+                    parent_message = find_parent_message(client, channel_id, thread_ts)
                     if parent_message is not None:
                         is_thread_for_this_app = is_this_app_mentioned(
                             context, parent_message
@@ -278,71 +331,80 @@ def respond_to_new_message(
         messages = []
         user_id = context.actor_user_id or context.user_id
         last_assistant_idx = -1
-        indices_to_remove = []
+        filtered_messages_in_context = []
         for idx, reply in enumerate(messages_in_context):
-            maybe_event_type = reply.get("metadata", {}).get("event_type")
-            if maybe_event_type == "litellm":
+            metadata = reply.get("metadata")
+            if metadata is not None and metadata.get("event_type") == "litellm":
                 if context.bot_id != reply.get("bot_id"):
                     # Remove messages by a different app
-                    indices_to_remove.append(idx)
                     continue
-                maybe_new_messages = (
-                    reply.get("metadata", {}).get("event_payload", {}).get("messages")
-                )
+                event_payload = metadata.get("event_payload") or {}
+                maybe_new_messages = event_payload.get("messages")
                 if maybe_new_messages is not None:
                     if len(messages) == 0 or user_id is None:
-                        new_user_id = (
-                            reply.get("metadata", {})
-                            .get("event_payload", {})
-                            .get("user")
-                        )
+                        new_user_id = event_payload.get("user")
                         if new_user_id is not None:
                             user_id = new_user_id
-                    messages = maybe_new_messages
+                    messages = list(maybe_new_messages)
                     last_assistant_idx = idx
 
+            # Strip bot Slack user ID from initial message
+            # (copied, since the fetched replies are shared through the cache)
+            if idx == 0 and f"<@{bot_user_id}>" in reply["text"]:
+                reply = {
+                    **reply,
+                    "text": _mention_pattern(bot_user_id).sub("", reply["text"]),
+                }
+            filtered_messages_in_context.append(reply)
+
+        if len(filtered_messages_in_context) == 0:
+            return
+
         if is_in_dm_with_bot is True or last_assistant_idx == -1:
             # To know whether this app needs to start a new convo
-            if not next(filter(lambda msg: msg["role"] == "system", messages), None):
+            # (the system message is only ever inserted at the head)
+            if not (messages and messages[0].get("role") == "system"):
                 # Replace placeholder for Slack user ID in the system prompt
                 system_text = build_system_text(
                     SYSTEM_TEXT, TRANSLATE_MARKDOWN, context
                 )
                 messages.insert(0, {"role": "system", "content": system_text})
 
-        filtered_messages_in_context = []
-        for idx, reply in enumerate(messages_in_context):
-            # Strip bot Slack user ID from initial message
-            if idx == 0:
-                reply["text"] = re.sub(
-                    f"<@{context.bot_user_id}>\\s*", "", reply["text"]
-                )
-            if idx not in indices_to_remove:
-                filtered_messages_in_context.append(reply)
-        if len(filtered_messages_in_context) == 0:
-            return
+        # The loading message only needs the system messages, so post it before
+        # the replies are converted and their images downloaded
+        loading_text = translate(context=context, text=DEFAULT_LOADING_TEXT)
+        wip_reply = post_wip_message(
+            client=client,
+            channel=channel_id,
+            thread_ts=thread_ts if is_in_dm_with_bot else ts,
+            loading_text=loading_text,
+            messages=messages,
+            user=user_id,
+        )
 
-        for reply in filtered_messages_in_context:
-            msg_user_id = reply.get("user")
-            reply_text = redact_string(reply.get("text"))
-            content = [
-                {
-                    "type": "text",
-                    "text": f"<@{msg_user_id}>: "
-                    + format_litellm_message_content(reply_text, TRANSLATE_MARKDOWN),
-                }
-            ]
-            if reply.get("bot_id") is None and can_send_image_url_to_litellm(context):
-                append_image_content_if_exists(
-                    bot_token=context.bot_token,
-                    files=reply.get("files"),
-                    content=content,
-                    logger=context.logger,
-                )
+        reply_texts = [
+            _format_reply_text(reply.get("user"), reply.get("text"))
+            for reply in filtered_messages_in_context
+        ]
+        image_content_futures = start_building_image_contents(
+            bot_token=bot_token,
+            files_per_message=_files_worth_downloading(
+                context, filtered_messages_in_context, reply_texts
+            ),
+            logger=context.logger,
+        )
+        for reply, reply_text, image_content in zip(
+            filtered_messages_in_context,
+            reply_texts,
+            collect_image_contents(image_content_futures),
+        ):
+            content = [{"type": "text", "text": reply_text}]
+            if image_content is not None:
+                content += image_content
 
             role = (
                 "assistant"
-                if "user" in reply and reply["user"] == context.bot_user_id
+                if "user" in reply and reply["user"] == bot_user_id
                 else "user"
             )
             messages.append(
@@ -352,26 +414,15 @@ def respond_to_new_message(
                 }
             )
 
-        loading_text = translate(context=context, text=DEFAULT_LOADING_TEXT)
-        wip_reply = post_wip_message(
-            client=client,
-            channel=context.channel_id,
-            thread_ts=payload.get("thread_ts") if is_in_dm_with_bot else payload["ts"],
-            loading_text=loading_text,
-            messages=messages,
-            user=user_id,
-        )
-
         (
             messages,
             num_context_tokens,
             max_context_tokens,
         ) = messages_within_context_window(messages)
-        num_messages = len([msg for msg in messages if msg.get("role") != "system"])
-        if num_messages == 0:
+        if not any(msg.get("role") != "system" for msg in messages):
             update_wip_message(
                 client=client,
-                channel=context.channel_id,
+                channel=channel_id,
                 ts=wip_reply["message"]["ts"],
                 text=f":warning: The previous message is too long ({num_context_tokens}/{max_context_tokens} prompt tokens).",
                 messages=messages,
@@ -384,19 +435,22 @@ def respond_to_new_message(
                 user=user_id,
             )
 
+            # Checked once the LLM has started responding, so that a reply posted in
+            # the meantime is caught; only the replies after the loading message matter
+            wip_ts = wip_reply["message"]["ts"]
             latest_replies = client.conversations_replies(
-                channel=context.channel_id,
+                channel=channel_id,
                 ts=wip_reply.get("ts"),
-                include_all_metadata=True,
-                limit=1000,
+                oldest=wip_ts,
+                limit=2,
             )
-            if (
-                latest_replies.get("messages", [])[-1]["ts"]
-                != wip_reply["message"]["ts"]
+            if any(
+                float(reply["ts"]) > float(wip_ts)
+                for reply in latest_replies.get("messages", [])
             ):
                 # Since a new reply will come soon, this app abandons this reply
                 client.chat_delete(
-                    channel=context.channel_id,
+                    channel=channel_id,
                     ts=wip_reply["message"]["ts"],
                 )
                 return
@@ -414,42 +468,29 @@ def respond_to_new_message(
 
     except (Timeout, TimeoutError):
         if wip_reply is not None:
-            text = (
-                (
-                    wip_reply.get("message", {}).get("text", "")
-                    if wip_reply is not None
-                    else ""
-                )
-                + "\n\n"
-                + translate(
-                    context=context,
-                    text=TIMEOUT_ERROR_MESSAGE,
-                )
+            text = _append_error_text(
+                wip_reply, translate(context=context, text=TIMEOUT_ERROR_MESSAGE)
             )
             client.chat_update(
-                channel=context.channel_id,
+                channel=channel_id,
                 ts=wip_reply["message"]["ts"],
                 text=text,
             )
     except Exception as e:
-        text = (
-            (
-                wip_reply.get("message", {}).get("text", "")
-                if wip_reply is not None
-                else ""
-            )
-            + "\n\n"
-            + f":warning: Failed to reply: {e}"
-        )
+        text = _append_error_text(wip_reply, f":warning: Failed to reply: {e}")
         logger.exception(text, e)
         if wip_reply is not None:
             client.chat_update(
-                channel=context.channel_id,
+                channel=channel_id,
                 ts=wip_reply["message"]["ts"],
                 text=text,
             )
 
 
+# The scopes rarely change, so avoid calling auth.test for every event
+_bot_scopes_cache = TTLCache(maxsize=1024, ttl_seconds=600)
+
+
 def register_listeners(app: App):
     # TODO: remove this workaround once bolt-python attaches scopes to context under the hood
     @app.middleware
@@ -460,8 +501,12 @@ def register_listeners(app: App):
             and context.authorize_result is not None
             and context.authorize_result.bot_scopes is None
         ):
-            auth_test = client.auth_test(token=context.bot_token)
-            scopes = auth_test.headers.get("x-oauth-scopes", [])
+            bot_token = context.bot_token
+            scopes = _bot_scopes_cache.get(bot_token)
+            if scopes is None:
+                auth_test = client.auth_test(token=bot_token)
+                scopes = auth_test.headers.get("x-oauth-scopes", [])
+                _bot_scopes_cache.set(bot_token, scopes)
             context.authorize_result.bot_scopes = scopes
         next_()
 
@@ -470,26 +515,45 @@ def register_listeners(app: App):
     app.event("message")(ack=just_ack, lazy=[respond_to_new_message])
 
 
-MESSAGE_SUBTYPES_TO_SKIP = ["message_changed", "message_deleted"]
+MESSAGE_SUBTYPES_TO_SKIP = frozenset({"message_changed", "message_deleted"})
+
+# Slack retries an event with the same event_id when it doesn't receive the ack in time
+_processed_event_ids = TTLCache(maxsize=4096, ttl_seconds=600)
 
 
 # To reduce unnecessary workload in this app,
-# this before_authorize function skips message changed/deleted events.
+# this before_authorize function skips message changed/deleted events and redelivered events.
 # Especially, "message_changed" events can be triggered many times when the app rapidly updates its reply.
 def before_authorize(
     body: dict,
     payload: dict,
+    request: BoltRequest,
     logger: logging.Logger,
     next_,
 ):
+    subtype = payload.get("subtype")
     if (
         is_event(body)
         and payload.get("type") == "message"
-        and payload.get("subtype") in MESSAGE_SUBTYPES_TO_SKIP
+        and subtype in MESSAGE_SUBTYPES_TO_SKIP
     ):
-        logger.debug(
-            "Skipped the following middleware and listeners "
-            f"for this message event (subtype: {payload.get('subtype')})"
-        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Skipped the following middleware and listeners "
+                f"for this message event (subtype: {subtype})"
+            )
+        return BoltResponse(status=200, body="")
+    if (
+        is_event(body)
+        # Lazy listener invocations on FaaS carry the same body as the original request
+        and not request.lazy_only
+        and body.get("event_id") is not None
+        and not _processed_event_ids.add((body.get("team_id"), body["event_id"]))
+    ):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Skipped the following middleware and listeners "
+                f"for this redelivered event (event_id: {body['event_id']})"
+            )
         return BoltResponse(status=200, body="")
     next_()
@@ -40,6 +40,11 @@ LITELLM_CALLBACK_MODULE_NAME = os.environ.get(
     "LITELLM_CALLBACK_MODULE_NAME", DEFAULT_LITELLM_CALLBACK_MODULE_NAME
 )
 
+DEFAULT_LISTENER_MAX_WORKERS = 16
+LISTENER_MAX_WORKERS = int(
+    os.environ.get("LISTENER_MAX_WORKERS", DEFAULT_LISTENER_MAX_WORKERS)
+)
+
 USE_SLACK_LANGUAGE = os.environ.get("USE_SLACK_LANGUAGE", "true") == "true"
 
 SLACK_APP_LOG_LEVEL = os.environ.get("SLACK_APP_LOG_LEVEL", "DEBUG")
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
 from slack_bolt import BoltContext
 
@@ -29,15 +29,20 @@ def from_locale_to_lang(locale: Optional[str]) -> Optional[str]:
     return _locale_to_lang.get(locale)
 
 
-_translation_result_cache = {}
+_translation_result_cache: Dict[Tuple[str, str], str] = {}
 
 
 def translate(*, context: BoltContext, text: str) -> str:
-    lang = from_locale_to_lang(context.get("locale"))
+    locale = context.get("locale")
+    if not locale:
+        # USE_SLACK_LANGUAGE is disabled or the user's locale is unknown
+        return text
+    lang = from_locale_to_lang(locale)
     if lang is None or lang == "English":
         return text
 
-    cached_result = _translation_result_cache.get(f"{lang}:{text}")
+    cache_key = (lang, text)
+    cached_result = _translation_result_cache.get(cache_key)
     if cached_result is not None:
         return cached_result
     response = call_litellm_completion(
@@ -64,5 +69,5 @@ def translate(*, context: BoltContext, text: str) -> str:
         user="system",
     )
     translated_text = response["choices"][0]["message"].get("content")
-    _translation_result_cache[f"{lang}:{text}"] = translated_text
+    _translation_result_cache[cache_key] = translated_text
     return translated_text
@@ -1,14 +1,75 @@
 import base64
 import logging
+from concurrent.futures import FIRST_EXCEPTION, Future, ThreadPoolExecutor, wait
 from io import BytesIO
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 from PIL import Image
 
+from app.env import LISTENER_MAX_WORKERS
 from app.slack_ops import download_slack_image_content
 
 SUPPORTED_IMAGE_FORMATS = ["jpeg", "png", "gif"]
 
+# Kept apart from the Slack I/O executor so that a thread full of images
+# doesn't hold up other conversations' reply updates
+_image_download_executor = ThreadPoolExecutor(max_workers=LISTENER_MAX_WORKERS)
+
+
+def start_building_image_contents(
+    *,
+    bot_token: str,
+    files_per_message: List[Optional[List[dict]]],
+    logger: logging.Logger,
+) -> List[Optional[Future]]:
+    """Starts downloading images per message; results are aligned with files_per_message"""
+    return [
+        (
+            _image_download_executor.submit(
+                build_image_content,
+                bot_token=bot_token,
+                files=files,
+                logger=logger,
+            )
+            if files
+            else None
+        )
+        for files in files_per_message
+    ]
+
+
+def collect_image_contents(
+    futures: List[Optional[Future]],
+) -> List[Optional[List[dict]]]:
+    """Waits for all the image contents; when one fails, the pending ones are cancelled"""
+    done, not_done = wait(
+        [future for future in futures if future is not None],
+        return_when=FIRST_EXCEPTION,
+    )
+    for future in not_done:
+        future.cancel()
+    for future in done:
+        error = future.exception()
+        if error is not None:
+            raise error
+    return [future.result() if future is not None else None for future in futures]
+
+
+def build_image_content(
+    *,
+    bot_token: str,
+    files: List[dict],
+    logger: logging.Logger,
+) -> List[dict]:
+    content: List[dict] = []
+    append_image_content_if_exists(
+        bot_token=bot_token,
+        files=files,
+        content=content,
+        logger=logger,
+    )
+    return content
+
 
 def append_image_content_if_exists(
     *,
@@ -1,8 +1,9 @@
 import json
 import os
 import re
-import threading
 import time
+from concurrent.futures import Future, wait
+from functools import lru_cache
 from importlib import import_module
 from typing import Dict, List, Optional, Tuple, Union
 
@@ -19,7 +20,8 @@ from app.env import (
     LITELLM_TOOLS_MODULE_NAME,
 )
 from app.markdown_conversion import markdown_to_slack, slack_to_markdown
-from app.slack_ops import update_wip_message
+from app.slack_constants import WIP_MESSAGE_UPDATE_INTERVAL_SECONDS
+from app.slack_ops import update_wip_message, wip_message_update_executor
 
 # ----------------------------
 # Internal functions
@@ -43,7 +45,10 @@ def format_litellm_message_content(
 
     # Unescape &, < and >, since Slack replaces these with their HTML equivalents
     # See also: https://api.slack.com/reference/surfaces/formatting#escaping
-    content = content.replace("&lt;", "<").replace("&gt;", ">").replace("&amp;", "&")
+    if "&" in content:
+        content = (
+            content.replace("&lt;", "<").replace("&gt;", ">").replace("&amp;", "&")
+        )
 
     # Convert from Slack mrkdwn to Markdown format
     if translate_markdown:
@@ -52,19 +57,71 @@ def format_litellm_message_content(
     return content
 
 
-# Remove old messages to make sure we have room for max_tokens
-def messages_within_context_window(
-    messages: List[Dict[str, Union[str, Dict[str, str]]]],
-) -> Tuple[List[Dict[str, Union[str, Dict[str, str]]]], int, int]:
+def calculate_max_context_tokens() -> int:
     max_context_tokens = (
         litellm.get_max_tokens(LITELLM_MODEL_TYPE) - LITELLM_MAX_TOKENS - 1
     )
     if LITELLM_TOOLS_MODULE_NAME is not None:
         max_context_tokens -= calculate_tokens_necessary_for_tools()
+    return max_context_tokens
+
+
+# Returns how many of the latest texts can fit in the context window.
+# Older messages are trimmed first, so once the text of the newer ones alone
+# exceeds the limit, anything older (including its images) will be dropped anyway.
+def count_latest_texts_within_context_window(texts: List[str]) -> int:
+    max_context_tokens = calculate_max_context_tokens()
+    # A token covers at least one byte, so most threads fit without tokenizing them
+    if sum(len(text.encode()) for text in texts) <= max_context_tokens:
+        return len(texts)
+    num_tokens = 0
+    for count, text in enumerate(reversed(texts)):
+        num_tokens += litellm.token_counter(model=LITELLM_MODEL_TYPE, text=text)
+        if num_tokens > max_context_tokens:
+            return count
+    return len(texts)
+
+
+# Counting the whole list again after every removal is quadratic for long threads,
+# so first remove the oldest messages that must go anyway, counting each of them once.
+# The last removal is left to the exact loop in messages_within_context_window.
+def _remove_messages_clearly_over_limit(
+    messages: List[Dict[str, Union[str, Dict[str, str]]]], num_excess_tokens: int
+) -> bool:
+    removable_indices = [
+        i
+        for i, message in enumerate(messages)
+        if message["role"] in ("user", "assistant", "function")
+    ]
+    # Tokens counted for any list of messages, such as the reply priming
+    num_base_tokens = litellm.token_counter(model=LITELLM_MODEL_TYPE, messages=[])
+    num_removals = 0
+    for i in removable_indices[:-1]:
+        num_message_tokens = (
+            litellm.token_counter(model=LITELLM_MODEL_TYPE, messages=[messages[i]])
+            - num_base_tokens
+        )
+        if num_message_tokens >= num_excess_tokens:
+            break
+        num_excess_tokens -= num_message_tokens
+        num_removals += 1
+    for i in reversed(removable_indices[:num_removals]):
+        del messages[i]
+    return num_removals > 0
+
+
+# Remove old messages to make sure we have room for max_tokens
+def messages_within_context_window(
+    messages: List[Dict[str, Union[str, Dict[str, str]]]],
+) -> Tuple[List[Dict[str, Union[str, Dict[str, str]]]], int, int]:
+    max_context_tokens = calculate_max_context_tokens()
     num_context_tokens = 0  # Number of tokens in the context window just before the earliest message is deleted
-    while (
-        num_tokens := litellm.token_counter(model=LITELLM_MODEL_TYPE, messages=messages)
-    ) > max_context_tokens:
+    num_tokens = litellm.token_counter(model=LITELLM_MODEL_TYPE, messages=messages)
+    if num_tokens > max_context_tokens and _remove_messages_clearly_over_limit(
+        messages, num_tokens - max_context_tokens
+    ):
+        num_tokens = litellm.token_counter(model=LITELLM_MODEL_TYPE, messages=messages)
+    while num_tokens > max_context_tokens:
         removed = False
         for i, message in enumerate(messages):
             if message["role"] in ("user", "assistant", "function"):
@@ -75,22 +132,32 @@ def messages_within_context_window(
         if not removed:
             # Fall through and let the LiteLLM error handler deal with it
             break
+        num_tokens = litellm.token_counter(model=LITELLM_MODEL_TYPE, messages=messages)
     else:
         num_context_tokens = num_tokens
 
     # Remove any non-user messages at the beginning of the list
-    while messages and messages[0]["role"] != "user":
+    first_user_idx = next(
+        (i for i, message in enumerate(messages) if message["role"] == "user"),
+        len(messages),
+    )
+    if first_user_idx > 0:
+        # Count the tokens just before the last message is removed, all at once
+        del messages[: first_user_idx - 1]
         num_context_tokens = litellm.token_counter(
             model=LITELLM_MODEL_TYPE, messages=messages
         )
         del messages[0]
 
     # Remove any assistant messages at the end of the list
-    while messages and messages[-1]["role"] == "assistant":
+    end_idx = len(messages)
+    while end_idx > 0 and messages[end_idx - 1]["role"] == "assistant":
+        end_idx -= 1
+    if end_idx < len(messages):
         num_context_tokens = litellm.token_counter(
-            model=LITELLM_MODEL_TYPE, messages=messages
+            model=LITELLM_MODEL_TYPE, messages=messages[: end_idx + 1]
         )
-        del messages[-1]
+        del messages[end_idx:]
 
     return messages, num_context_tokens, max_context_tokens
 
@@ -157,8 +224,12 @@ def consume_litellm_stream_to_write_reply(
         "content": "",
     }
     messages.append(assistant_reply)
+    # Collected as parts and joined only when needed, rather than
+    # growing the content string for every delta
+    content_parts: List[str] = []
     word_count = 0
-    threads = []
+    last_update_time = 0.0
+    update_futures: List[Future] = []
     chunks: List = []
     try:
         loading_character = " ... :writing_hand:"
@@ -171,10 +242,19 @@ def consume_litellm_stream_to_write_reply(
             if item.get("finish_reason") is not None:
                 break
             delta = item.get("delta")
-            if delta.get("content") is not None:
+            delta_content = delta.get("content")
+            if delta_content is not None:
                 word_count += 1
-                assistant_reply["content"] += delta.get("content")
-                if word_count >= 20:
+                content_parts.append(delta_content)
+                # Throttle interim updates so that chat.update stays within Slack's rate limits;
+                # while the previous one is still in flight (e.g. retrying after a 429), skip
+                if (
+                    word_count >= 20
+                    and time.time() - last_update_time
+                    >= WIP_MESSAGE_UPDATE_INTERVAL_SECONDS
+                    and (not update_futures or update_futures[-1].done())
+                ):
+                    assistant_reply["content"] = "".join(content_parts)
 
                     def update_message():
                         assistant_reply_text = format_assistant_reply(
@@ -190,18 +270,14 @@ def consume_litellm_stream_to_write_reply(
                             user=user_id,
                         )
 
-                    thread = threading.Thread(target=update_message)
-                    thread.daemon = True
-                    thread.start()
-                    threads.append(thread)
+                    update_futures.append(
+                        wip_message_update_executor.submit(update_message)
+                    )
+                    last_update_time = time.time()
                     word_count = 0
 
-        for t in threads:
-            try:
-                if t.is_alive():
-                    t.join()
-            except Exception:
-                pass
+        assistant_reply["content"] = "".join(content_parts)
+        wait(update_futures)
 
         response = litellm.stream_chunk_builder(chunks)
         response_message = response.choices[0].message
@@ -253,20 +329,15 @@ def consume_litellm_stream_to_write_reply(
             user=user_id,
         )
     finally:
-        for t in threads:
-            try:
-                if t.is_alive():
-                    t.join()
-            except Exception:
-                pass
+        wait(update_futures)
         try:
             stream.close()
         except Exception:
             pass
 
 
-# Format message from LiteLLM to display in Slack
-def format_assistant_reply(content: str, translate_markdown: bool) -> str:
+_ASSISTANT_REPLY_REPLACEMENTS = [
+    (re.compile(o), n)
     for o, n in [
         # Remove leading newlines
         ("^\n+", ""),
@@ -299,8 +370,14 @@ def format_assistant_reply(content: str, translate_markdown: bool) -> str:
         ("```\\s*[Jj]ava[Ss]cript\n", "```\n"),
         ("```\\s*[Ty]ype[Ss]cript\n", "```\n"),
         ("```\\s*[Pp]ython\n", "```\n"),
-    ]:
-        content = re.sub(o, n, content)
+    ]
+]
+
+
+# Format message from LiteLLM to display in Slack
+def format_assistant_reply(content: str, translate_markdown: bool) -> str:
+    for pattern, replacement in _ASSISTANT_REPLY_REPLACEMENTS:
+        content = pattern.sub(replacement, content)
 
     # Convert from Markdown to Slack mrkdwn format
     if translate_markdown:
@@ -312,7 +389,17 @@ def format_assistant_reply(content: str, translate_markdown: bool) -> str:
 def build_system_text(
     system_text_template: str, translate_markdown: bool, context: BoltContext
 ):
-    system_text = system_text_template.format(bot_user_id=context.bot_user_id)
+    return _build_system_text(
+        system_text_template, translate_markdown, context.bot_user_id
+    )
+
+
+# The inputs are fixed per deployment, so the prompt is built only once per bot user
+@lru_cache(maxsize=4)
+def _build_system_text(
+    system_text_template: str, translate_markdown: bool, bot_user_id: Optional[str]
+) -> str:
+    system_text = system_text_template.format(bot_user_id=bot_user_id)
     # Translate format hint in system prompt
     if translate_markdown is True:
         system_text = slack_to_markdown(system_text)
@@ -1,11 +1,50 @@
 import re
 
+# Code blocks and inline code, which must be left as-is
+_CODE_SPLIT_PATTERN = re.compile(r"(?s)(```.+?```|`[^`\n]+?`)")
+
+# Each replacement comes with the marker it needs, to skip parts without it
+_SLACK_TO_MARKDOWN_REPLACEMENTS = [
+    (m, re.compile(o), n)
+    for m, o, n in [
+        ("*", r"\*(?!\s)([^\*\n]+?)(?<!\s)\*", r"**\1**"),  # *bold* to **bold**
+        ("_", r"_(?!\s)([^_\n]+?)(?<!\s)_", r"*\1*"),  # _italic_ to *italic*
+        ("~", r"~(?!\s)([^~\n]+?)(?<!\s)~", r"~~\1~~"),  # ~strike~ to ~~strike~~
+    ]
+]
+
+_MARKDOWN_TO_SLACK_REPLACEMENTS = [
+    (m, re.compile(o), n)
+    for m, o, n in [
+        (
+            "***",
+            r"\*\*\*(?!\s)([^\*\n]+?)(?<!\s)\*\*\*",
+            r"_*\1*_",
+        ),  # ***bold italic*** to *_bold italic_*
+        (
+            "*",
+            r"(?<![\*_])\*(?!\s)([^\*\n]+?)(?<!\s)\*(?![\*_])",
+            r"_\1_",
+        ),  # *italic* to _italic_
+        ("**", r"\*\*(?!\s)([^\*\n]+?)(?<!\s)\*\*", r"*\1*"),  # **bold** to *bold*
+        ("__", r"__(?!\s)([^_\n]+?)(?<!\s)__", r"*\1*"),  # __bold__ to *bold*
+        ("~~", r"~~(?!\s)([^~\n]+?)(?<!\s)~~", r"~\1~"),  # ~~strike~~ to ~strike~
+    ]
+]
+
 
 # Conversion from Slack mrkdwn to Markdown
 # See also: https://api.slack.com/reference/surfaces/formatting#basics
 def slack_to_markdown(content: str) -> str:
+    # The shortest convertible text is a single character with markers like *a*
+    if len(content) < 3:
+        return content
+    # Most messages have no markers at all
+    if "*" not in content and "_" not in content and "~" not in content:
+        return content
+
     # Split the input string into parts based on code blocks and inline code
-    parts = re.split(r"(?s)(```.+?```|`[^`\n]+?`)", content)
+    parts = _CODE_SPLIT_PATTERN.split(content)
 
     # Apply the bold, italic, and strikethrough formatting to text not within code
     result = ""
@@ -13,12 +52,9 @@ def slack_to_markdown(content: str) -> str:
         if part.startswith("```") or part.startswith("`"):
             result += part
         else:
-            for o, n in [
-                (r"\*(?!\s)([^\*\n]+?)(?<!\s)\*", r"**\1**"),  # *bold* to **bold**
-                (r"_(?!\s)([^_\n]+?)(?<!\s)_", r"*\1*"),  # _italic_ to *italic*
-                (r"~(?!\s)([^~\n]+?)(?<!\s)~", r"~~\1~~"),  # ~strike~ to ~~strike~~
-            ]:
-                part = re.sub(o, n, part)
+            for marker, pattern, replacement in _SLACK_TO_MARKDOWN_REPLACEMENTS:
+                if marker in part:
+                    part = pattern.sub(replacement, part)
             result += part
     return result
 
@@ -27,7 +63,7 @@ def slack_to_markdown(content: str) -> str:
 # See also: https://api.slack.com/reference/surfaces/formatting#basics
 def markdown_to_slack(content: str) -> str:
     # Split the input string into parts based on code blocks and inline code
-    parts = re.split(r"(?s)(```.+?```|`[^`\n]+?`)", content)
+    parts = _CODE_SPLIT_PATTERN.split(content)
 
     # Apply the bold, italic, and strikethrough formatting to text not within code
     result = ""
@@ -35,19 +71,8 @@ def markdown_to_slack(content: str) -> str:
         if part.startswith("```") or part.startswith("`"):
             result += part
         else:
-            for o, n in [
-                (
-                    r"\*\*\*(?!\s)([^\*\n]+?)(?<!\s)\*\*\*",
-                    r"_*\1*_",
-                ),  # ***bold italic*** to *_bold italic_*
-                (
-                    r"(?<![\*_])\*(?!\s)([^\*\n]+?)(?<!\s)\*(?![\*_])",
-                    r"_\1_",
-                ),  # *italic* to _italic_
-                (r"\*\*(?!\s)([^\*\n]+?)(?<!\s)\*\*", r"*\1*"),  # **bold** to *bold*
-                (r"__(?!\s)([^_\n]+?)(?<!\s)__", r"*\1*"),  # __bold__ to *bold*
-                (r"~~(?!\s)([^~\n]+?)(?<!\s)~~", r"~\1~"),  # ~~strike~~ to ~strike~
-            ]:
-                part = re.sub(o, n, part)
+            for marker, pattern, replacement in _MARKDOWN_TO_SLACK_REPLACEMENTS:
+                if marker in part:
+                    part = pattern.sub(replacement, part)
             result += part
     return result
@@ -1,4 +1,5 @@
 import re
+from typing import Callable, List, Pattern, Sequence, Tuple, Union
 
 from app.env import (
     REDACT_CREDIT_CARD_PATTERN,
@@ -9,6 +10,55 @@ from app.env import (
     REDACTION_ENABLED,
 )
 
+REDACT_PATTERN_SOURCES = [
+    (REDACT_EMAIL_PATTERN, "[EMAIL]"),
+    (REDACT_CREDIT_CARD_PATTERN, "[CREDIT CARD]"),
+    (REDACT_PHONE_PATTERN, "[PHONE]"),
+    (REDACT_SSN_PATTERN, "[SSN]"),
+    (REDACT_USER_DEFINED_PATTERN, "[REDACTED]"),
+]
+
+_DEFAULT_FLAGS = re.compile("").flags
+
+
+def compile_redact_patterns(
+    sources: Sequence[Tuple[str, str]],
+) -> Tuple[Tuple[Pattern, Union[str, Callable[[re.Match], str]]], ...]:
+    """
+    Compile redaction patterns, merging consecutive simple patterns into a single
+    alternation so that a message is scanned once instead of once per pattern
+
+    Patterns with capturing groups or global inline flags are kept as separate passes,
+    since wrapping them in an alternation would change their meaning.
+    """
+    compiled: List[Tuple[Pattern, Union[str, Callable[[re.Match], str]]]] = []
+    mergeable: List[Tuple[Pattern, str]] = []
+
+    def flush_mergeable():
+        if len(mergeable) == 1:
+            compiled.append(mergeable[0])
+        elif len(mergeable) > 1:
+            replacements = [replacement for _, replacement in mergeable]
+            union = re.compile("|".join(f"({p.pattern})" for p, _ in mergeable))
+            compiled.append((union, lambda m: replacements[m.lastindex - 1]))
+        mergeable.clear()
+
+    for source, replacement in sources:
+        pattern = re.compile(source)
+        if pattern.groups == 0 and pattern.flags == _DEFAULT_FLAGS:
+            mergeable.append((pattern, replacement))
+        else:
+            flush_mergeable()
+            compiled.append((pattern, replacement))
+    flush_mergeable()
+    return tuple(compiled)
+
+
+# Compiled once at import time, since redaction runs on every message in a thread
+REDACT_PATTERNS = (
+    compile_redact_patterns(REDACT_PATTERN_SOURCES) if REDACTION_ENABLED else ()
+)
+
 
 def redact_string(input_string: str) -> str:
     """
@@ -21,13 +71,7 @@ def redact_string(input_string: str) -> str:
         - str: the redacted string
     """
     output_string = input_string
-    if REDACTION_ENABLED:
-        output_string = re.sub(REDACT_EMAIL_PATTERN, "[EMAIL]", output_string)
-        output_string = re.sub(
-            REDACT_CREDIT_CARD_PATTERN, "[CREDIT CARD]", output_string
-        )
-        output_string = re.sub(REDACT_PHONE_PATTERN, "[PHONE]", output_string)
-        output_string = re.sub(REDACT_SSN_PATTERN, "[SSN]", output_string)
-        output_string = re.sub(REDACT_USER_DEFINED_PATTERN, "[REDACTED]", output_string)
+    for pattern, replacement in REDACT_PATTERNS:
+        output_string = pattern.sub(replacement, output_string)
 
     return output_string
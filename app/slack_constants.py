@@ -8,3 +8,6 @@ TIMEOUT_ERROR_MESSAGE = (
 )
 
 DEFAULT_LOADING_TEXT = ":hourglass_flowing_sand: Wait a second, please ..."
+
+# chat.update is a Tier 3 method, so interim updates of a streamed reply are sent at most once per interval
+WIP_MESSAGE_UPDATE_INTERVAL_SECONDS = 1
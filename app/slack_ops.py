@@ -1,24 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from http.cookiejar import DefaultCookiePolicy
 from typing import Dict, List, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
 from litellm import supports_vision
 from slack_bolt import BoltContext
 from slack_sdk.errors import SlackApiError
 from slack_sdk.web import SlackResponse, WebClient
 
-from app.env import IMAGE_FILE_ACCESS_ENABLED, LITELLM_MODEL_TYPE
+from app.env import (
+    IMAGE_FILE_ACCESS_ENABLED,
+    LISTENER_MAX_WORKERS,
+    LITELLM_MODEL_TYPE,
+)
+from app.ttl_cache import TTLCache
+
+# Shared by all listeners for Slack API calls they wait on (fetching the rest of a thread).
+# Each listener thread waits on at most one call at a time.
+slack_io_executor = ThreadPoolExecutor(max_workers=LISTENER_MAX_WORKERS)
+
+# Interim reply updates while streaming run on their own threads; chat.update can be
+# rate-limited, and the retry handler then sleeps in the worker until Retry-After.
+# Each streaming reply has at most one update in flight.
+wip_message_update_executor = ThreadPoolExecutor(max_workers=LISTENER_MAX_WORKERS)
+
+# Reuse connections to files.slack.com instead of paying a TLS handshake per file
+_files_session = requests.Session()
+_files_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+# The session is shared by all bot tokens, so never keep or send cookies
+_files_session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
 
 # ----------------------------
 # General operations in a channel
 # ----------------------------
 
 
+# Both the app_mention and message listeners (and Slack's retries) fetch the same
+# conversation for a single user message, so the results are kept for a few seconds.
+# Entries are keyed by the ts of the triggering message, so a newer message always
+# results in a fresh fetch, and only a handful of recent events are worth keeping.
+_conversations_cache = TTLCache(maxsize=32, ttl_seconds=8)
+
+# Slack recommends no more than 200 results per page
+THREAD_REPLIES_PAGE_SIZE = 200
+MAX_THREAD_REPLIES = 1000
+
+
 def find_parent_message(
     client: WebClient, channel_id: Optional[str], thread_ts: Optional[str]
 ) -> Optional[dict]:
     if channel_id is None or thread_ts is None:
         return None
 
+    cache_key = ("parent_message", channel_id, thread_ts)
+    cached_message = _conversations_cache.get(cache_key)
+    if cached_message is not None:
+        return cached_message
+
     messages = client.conversations_history(
         channel=channel_id,
         latest=thread_ts,
@@ -26,7 +66,79 @@ def find_parent_message(
         inclusive=True,
     ).get("messages", [])
 
-    return messages[0] if len(messages) > 0 else None
+    if len(messages) == 0:
+        return None
+    _conversations_cache.set(cache_key, messages[0])
+    return messages[0]
+
+
+def fetch_thread_replies_page(
+    client: WebClient,
+    channel_id: str,
+    thread_ts: str,
+    cursor: Optional[str] = None,
+) -> SlackResponse:
+    return client.conversations_replies(
+        channel=channel_id,
+        ts=thread_ts,
+        include_all_metadata=True,
+        limit=THREAD_REPLIES_PAGE_SIZE,
+        cursor=cursor,
+    )
+
+
+def find_thread_replies(
+    client: WebClient,
+    channel_id: str,
+    thread_ts: str,
+    event_ts: str,
+    first_page: Optional[SlackResponse] = None,
+) -> List[dict]:
+    cache_key = ("thread_replies", channel_id, thread_ts, event_ts)
+    replies = _conversations_cache.get(cache_key)
+    if replies is None:
+        replies = []
+        cursor = None
+        # The caller may have fetched the first page already
+        response = first_page
+        while len(replies) < MAX_THREAD_REPLIES:
+            if response is None:
+                response = fetch_thread_replies_page(
+                    client, channel_id, thread_ts, cursor
+                )
+            messages = response.get("messages", [])
+            if replies and messages and messages[0].get("ts") == thread_ts:
+                # The parent message can be included in every page
+                messages = messages[1:]
+            replies += messages
+            cursor = response.get("response_metadata", {}).get("next_cursor")
+            if not cursor:
+                break
+            response = None
+        replies = replies[:MAX_THREAD_REPLIES]
+        _conversations_cache.set(cache_key, replies)
+    # Return a copy so that callers can reorder the list without touching the cache
+    return list(replies)
+
+
+def find_dm_history(
+    client: WebClient, channel_id: str, event_ts: str, oldest: str
+) -> List[dict]:
+    cache_key = ("dm_history", channel_id, event_ts)
+    messages = _conversations_cache.get(cache_key)
+    if messages is None:
+        # Without latest, Slack would return the oldest messages after oldest
+        messages = client.conversations_history(
+            channel=channel_id,
+            latest=event_ts,
+            oldest=oldest,
+            inclusive=True,
+            include_all_metadata=True,
+            limit=100,
+        ).get("messages", [])
+        _conversations_cache.set(cache_key, messages)
+    # Slack returns the history newest first; reversing also copies the cached list
+    return list(reversed(messages))
 
 
 def is_this_app_mentioned(context: BoltContext, parent_message: dict) -> bool:
@@ -92,11 +204,17 @@ def can_send_image_url_to_litellm(context: BoltContext) -> bool:
     can_access_files = context and "files:read" in bot_scopes
     if can_access_files is False:
         return False
+    return _model_supports_vision()
+
+
+# The model never changes while the app is running
+@lru_cache(maxsize=1)
+def _model_supports_vision() -> bool:
     return supports_vision(model=LITELLM_MODEL_TYPE)
 
 
 def download_slack_image_content(image_url: str, bot_token: str) -> bytes:
-    response = requests.get(
+    response = _files_session.get(
         image_url,
         headers={"Authorization": f"Bearer {bot_token}"},
     )
@@ -0,0 +1,50 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """A small thread-safe cache whose entries expire after ttl_seconds"""
+
+    def __init__(self, *, maxsize: int, ttl_seconds: float):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        # Kept in insertion order, which is also the order the entries expire in
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def add(self, key: Hashable, value: Any = True) -> bool:
+        """Stores the value only when the key is missing; returns whether it was stored"""
+        with self._lock:
+            now = time.monotonic()
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return False
+            self._store(key, value, now)
+            return True
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._store(key, value, time.monotonic())
+
+    def _store(self, key: Hashable, value: Any, now: float) -> None:
+        self._entries[key] = (now + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        # Entries that are never read again must not pile up until maxsize
+        while self._entries and (
+            len(self._entries) > self.maxsize
+            or next(iter(self._entries.values()))[0] <= now
+        ):
+            self._entries.popitem(last=False)
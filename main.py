@@ -1,12 +1,13 @@
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 from slack_bolt import App, BoltContext
 from slack_sdk.http_retry.builtin_handlers import RateLimitErrorRetryHandler
 from slack_sdk.web import WebClient
 
 from app.bolt_listeners import before_authorize, register_listeners
-from app.env import SLACK_APP_LOG_LEVEL, USE_SLACK_LANGUAGE
+from app.env import LISTENER_MAX_WORKERS, SLACK_APP_LOG_LEVEL, USE_SLACK_LANGUAGE
 
 if __name__ == "__main__":
     from slack_bolt.adapter.socket_mode import SocketModeHandler
@@ -17,6 +18,9 @@ if __name__ == "__main__":
         token=os.environ["SLACK_BOT_TOKEN"],
         before_authorize=before_authorize,
         process_before_response=True,
+        # Lazy listeners stream AI responses for a long time after ack(),
+        # so they get a dedicated pool larger than Bolt's default (10 workers)
+        listener_executor=ThreadPoolExecutor(max_workers=LISTENER_MAX_WORKERS),
     )
     app.client.retry_handlers.append(RateLimitErrorRetryHandler(max_retry_count=2))
 
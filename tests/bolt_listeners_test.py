@@ -0,0 +1,108 @@
+import logging
+
+from slack_bolt import BoltRequest
+
+from app.bolt_listeners import (
+    _files_worth_downloading,
+    _format_reply_text,
+    before_authorize,
+)
+from app.ttl_cache import TTLCache
+
+
+def call_before_authorize(body: dict, headers: dict = None):
+    calls = []
+    request = BoltRequest(body=body, headers=headers, mode="socket_mode")
+    response = before_authorize(
+        body=body,
+        payload=body.get("event", {}),
+        request=request,
+        logger=logging.getLogger(__name__),
+        next_=lambda: calls.append(True),
+    )
+    return response, len(calls)
+
+
+def build_event_body(event_id=None) -> dict:
+    body = {
+        "type": "event_callback",
+        "team_id": "T111",
+        "event": {"type": "message", "text": "Hi", "ts": "1.0"},
+    }
+    if event_id is not None:
+        body["event_id"] = event_id
+    return body
+
+
+def test_before_authorize_skips_redelivered_events(monkeypatch):
+    monkeypatch.setattr(
+        "app.bolt_listeners._processed_event_ids",
+        TTLCache(maxsize=16, ttl_seconds=600),
+    )
+    body = build_event_body("Ev111")
+
+    response, num_next_calls = call_before_authorize(body)
+    assert response is None
+    assert num_next_calls == 1
+
+    response, num_next_calls = call_before_authorize(body)
+    assert response.status == 200
+    assert num_next_calls == 0
+
+
+def test_before_authorize_passes_lazy_listener_invocations(monkeypatch):
+    monkeypatch.setattr(
+        "app.bolt_listeners._processed_event_ids",
+        TTLCache(maxsize=16, ttl_seconds=600),
+    )
+    body = build_event_body("Ev111")
+    call_before_authorize(body)
+
+    response, num_next_calls = call_before_authorize(
+        body, headers={"x-slack-bolt-lazy-only": "1"}
+    )
+    assert response is None
+    assert num_next_calls == 1
+
+
+def test_before_authorize_passes_events_without_event_id(monkeypatch):
+    monkeypatch.setattr(
+        "app.bolt_listeners._processed_event_ids",
+        TTLCache(maxsize=16, ttl_seconds=600),
+    )
+    body = build_event_body()
+
+    for _ in range(2):
+        response, num_next_calls = call_before_authorize(body)
+        assert response is None
+        assert num_next_calls == 1
+
+
+def test_files_worth_downloading_counts_the_text_sent(monkeypatch):
+    # Every character costs 1 token, and there is room for 30 tokens
+    monkeypatch.setattr(
+        "app.litellm_ops.litellm.token_counter", lambda model, text: len(text)
+    )
+    monkeypatch.setattr(
+        "app.litellm_ops.litellm.get_max_tokens", lambda model: 30 + 1024 + 1
+    )
+    monkeypatch.setattr(
+        "app.bolt_listeners.can_send_image_url_to_litellm", lambda context: True
+    )
+    files = [{"mimetype": "image/png"}]
+    replies = [
+        {"user": "U111", "text": "old", "files": files},
+        {"user": "U222", "text": "&lt;" * 10, "files": files},
+        {"user": "U333", "bot_id": "B111", "text": "hi", "files": files},
+    ]
+    reply_texts = [
+        _format_reply_text(reply["user"], reply["text"]) for reply in replies
+    ]
+    assert reply_texts[1] == "<@U222>: " + "<" * 10
+
+    # The latest two replies fit only once the entities are unescaped
+    assert _files_worth_downloading(None, replies, reply_texts) == [
+        None,
+        files,
+        None,
+    ]
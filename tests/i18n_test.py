@@ -0,0 +1,21 @@
+from slack_bolt import BoltContext
+
+from app import i18n
+from app.i18n import translate
+
+
+def test_translate_without_locale():
+    assert translate(context=BoltContext(), text="Hello") == "Hello"
+
+
+def test_translate_into_english():
+    context = BoltContext(locale="en-GB")
+    assert translate(context=context, text="Hello") == "Hello"
+
+
+def test_translate_uses_cached_result(monkeypatch):
+    monkeypatch.setattr(
+        i18n, "_translation_result_cache", {("Japanese", "Hello"): "こんにちは"}
+    )
+    context = BoltContext(locale="ja-JP")
+    assert translate(context=context, text="Hello") == "こんにちは"
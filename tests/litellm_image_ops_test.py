@@ -1,10 +1,16 @@
 import base64
+import logging
+from concurrent.futures import Future
 from io import BytesIO
 
 import pytest
 from PIL import Image
 
-from app.litellm_image_ops import encode_image_and_guess_format
+from app.litellm_image_ops import (
+    collect_image_contents,
+    encode_image_and_guess_format,
+    start_building_image_contents,
+)
 
 # Constants
 IMAGE_DIMENSIONS = (100, 100)
@@ -39,3 +45,42 @@ def test_encode_image_and_guess_format(image_format, expected_mode):
     assert decoded_image.format == image_format
     assert decoded_image.size == IMAGE_DIMENSIONS
     assert decoded_image.mode == expected_mode
+
+
+def test_start_building_image_contents(monkeypatch):
+    image_data = {
+        "https://files.slack.com/a.png": create_image_data("PNG"),
+        "https://files.slack.com/b.gif": create_image_data("GIF"),
+    }
+    monkeypatch.setattr(
+        "app.litellm_image_ops.download_slack_image_content",
+        lambda url, token: image_data[url],
+    )
+    futures = start_building_image_contents(
+        bot_token="xoxb-",
+        files_per_message=[
+            [{"mimetype": "image/png", "url_private": "https://files.slack.com/a.png"}],
+            None,
+            [{"mimetype": "image/gif", "url_private": "https://files.slack.com/b.gif"}],
+        ],
+        logger=logging.getLogger(__name__),
+    )
+
+    assert futures[1] is None
+    assert [
+        [item["image_url"]["url"].split(";")[0] for item in future.result()]
+        for future in (futures[0], futures[2])
+    ] == [["data:image/png"], ["data:image/gif"]]
+
+
+def test_collect_image_contents_cancels_pending_downloads_on_error():
+    done = Future()
+    done.set_result([{"type": "image_url"}])
+    failed = Future()
+    failed.set_exception(RuntimeError("Failed to download"))
+    pending = Future()
+
+    assert collect_image_contents([done, None]) == [[{"type": "image_url"}], None]
+    with pytest.raises(RuntimeError, match="Failed to download"):
+        collect_image_contents([done, pending, None, failed])
+    assert pending.cancelled()
@@ -1,4 +1,12 @@
-from app.litellm_ops import format_assistant_reply, format_litellm_message_content
+from slack_bolt import BoltContext
+
+from app.litellm_ops import (
+    build_system_text,
+    count_latest_texts_within_context_window,
+    format_assistant_reply,
+    format_litellm_message_content,
+    messages_within_context_window,
+)
 
 
 def test_format_assistant_reply():
@@ -63,6 +71,96 @@ int main(int argc, char *argv[])
     return 0;
 }""",
         ),
+        ("", ""),
+        ("ok", "ok"),
+        ("&amp;lt; is an escaped &lt;", "&lt; is an escaped <"),
     ]:
         result = format_litellm_message_content(content, False)
         assert result == expected
+
+
+def test_build_system_text():
+    context = BoltContext(bot_user_id="U123")
+    template = "Your Slack user ID is <@{bot_user_id}>. Format bold text *like this*."
+    assert (
+        build_system_text(template, False, context)
+        == "Your Slack user ID is <@U123>. Format bold text *like this*."
+    )
+    assert (
+        build_system_text(template, True, context)
+        == "Your Slack user ID is <@U123>. Format bold text **like this**."
+    )
+
+
+def test_messages_within_context_window(monkeypatch):
+    # Every message costs 10 tokens, and there is room for 3 messages
+    monkeypatch.setattr(
+        "app.litellm_ops.litellm.token_counter",
+        lambda model, messages: 10 * len(messages),
+    )
+    monkeypatch.setattr(
+        "app.litellm_ops.litellm.get_max_tokens", lambda model: 30 + 1024 + 1
+    )
+    messages = [
+        {"role": "user", "content": "1"},
+        {"role": "assistant", "content": "2"},
+        {"role": "assistant", "content": "3"},
+        {"role": "user", "content": "4"},
+        {"role": "assistant", "content": "5"},
+    ]
+    result, num_context_tokens, max_context_tokens = messages_within_context_window(
+        messages
+    )
+
+    assert result is messages
+    assert [message["content"] for message in messages] == ["4"]
+    assert num_context_tokens == 20
+    assert max_context_tokens == 30
+
+
+def test_messages_within_context_window_long_conversation(monkeypatch):
+    # Every message costs 10 tokens, and there is room for 3 messages
+    monkeypatch.setattr(
+        "app.litellm_ops.litellm.token_counter",
+        lambda model, messages: 10 * len(messages),
+    )
+    monkeypatch.setattr(
+        "app.litellm_ops.litellm.get_max_tokens", lambda model: 30 + 1024 + 1
+    )
+    messages = [{"role": "system", "content": "system"}] + [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": str(i)}
+        for i in range(100)
+    ]
+    result, num_context_tokens, max_context_tokens = messages_within_context_window(
+        messages
+    )
+
+    assert result is messages
+    assert [message["content"] for message in messages] == ["98"]
+    assert num_context_tokens == 20
+    assert max_context_tokens == 30
+
+
+def test_count_latest_texts_within_context_window(monkeypatch):
+    # Every character costs 1 token, and there is room for 30 tokens
+    monkeypatch.setattr(
+        "app.litellm_ops.litellm.token_counter", lambda model, text: len(text)
+    )
+    monkeypatch.setattr(
+        "app.litellm_ops.litellm.get_max_tokens", lambda model: 30 + 1024 + 1
+    )
+    assert count_latest_texts_within_context_window([]) == 0
+    assert count_latest_texts_within_context_window(["a" * 10, "b" * 20]) == 2
+    assert count_latest_texts_within_context_window(["a", "b" * 10, "c" * 20]) == 2
+    assert count_latest_texts_within_context_window(["a" * 31]) == 0
+
+
+def test_count_latest_texts_within_context_window_skips_short_texts(monkeypatch):
+    def token_counter(model, text):
+        raise AssertionError("Texts within the limit in bytes need no counting")
+
+    monkeypatch.setattr("app.litellm_ops.litellm.token_counter", token_counter)
+    monkeypatch.setattr(
+        "app.litellm_ops.litellm.get_max_tokens", lambda model: 30 + 1024 + 1
+    )
+    assert count_latest_texts_within_context_window(["a" * 10, "\u3042" * 6]) == 2
@@ -88,6 +88,10 @@ def test_slack_to_markdown():
             "```Some `*bold text* inside inline code` inside a code block``` shouldn't be changed.",
         ),
         ("* bullets shouldn't\n* be changed", "* bullets shouldn't\n* be changed"),
+        ("", ""),
+        ("**", "**"),
+        ("*a*", "**a**"),
+        ("No markers, `code` or ```blocks```", "No markers, `code` or ```blocks```"),
         (
             "* not bold*, *not bold *, * not bold *, **, * *, *  *, *   *",
             "* not bold*, *not bold *, * not bold *, **, * *, *  *, *   *",
@@ -0,0 +1,51 @@
+from app import sensitive_info_redaction
+from app.sensitive_info_redaction import (
+    REDACT_PATTERN_SOURCES,
+    compile_redact_patterns,
+    redact_string,
+)
+
+
+def test_redact_string_when_disabled():
+    text = "Contact me at foo@example.com"
+    assert redact_string(text) == text
+
+
+def test_redact_string(monkeypatch):
+    monkeypatch.setattr(
+        sensitive_info_redaction,
+        "REDACT_PATTERNS",
+        compile_redact_patterns(REDACT_PATTERN_SOURCES),
+    )
+    for content, expected in [
+        ("Contact me at foo@example.com", "Contact me at [EMAIL]"),
+        ("My card is 4111 1111 1111 1111", "My card is [CREDIT CARD]"),
+        ("Call (555) 123-4567 now", "Call [PHONE] now"),
+        ("SSN: 123-45-6789", "SSN: [SSN]"),
+        (
+            "foo@example.com, 555-123-4567 and 123-45-6789",
+            "[EMAIL], [PHONE] and [SSN]",
+        ),
+        ("Nothing to hide", "Nothing to hide"),
+    ]:
+        assert redact_string(content) == expected
+
+
+def test_compile_redact_patterns():
+    # Simple patterns are merged into a single pass
+    assert len(compile_redact_patterns(REDACT_PATTERN_SOURCES)) == 1
+
+    # Patterns with groups or global flags are applied as separate passes
+    patterns = compile_redact_patterns(
+        [
+            (r"foo", "[FOO]"),
+            (r"bar", "[BAR]"),
+            (r"(\w)\1{2}", "[TRIPLE]"),
+            (r"(?i)baz", "[BAZ]"),
+        ]
+    )
+    assert len(patterns) == 3
+    text = "foo bar aaa BAZ"
+    for pattern, replacement in patterns:
+        text = pattern.sub(replacement, text)
+    assert text == "[FOO] [BAR] [TRIPLE] [BAZ]"
@@ -0,0 +1,68 @@
+from app.slack_ops import find_dm_history, find_thread_replies
+
+
+class FakeClient:
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = []
+
+    def conversations_replies(self, **kwargs):
+        self.calls.append(kwargs)
+        return self.pages[len(self.calls) - 1]
+
+    def conversations_history(self, **kwargs):
+        self.calls.append(kwargs)
+        return self.pages[len(self.calls) - 1]
+
+
+def test_find_thread_replies_follows_cursor():
+    client = FakeClient(
+        [
+            {
+                "messages": [{"ts": "1.0"}, {"ts": "1.1"}],
+                "response_metadata": {"next_cursor": "next"},
+            },
+            {
+                "messages": [{"ts": "1.0"}, {"ts": "1.2"}],
+                "response_metadata": {"next_cursor": ""},
+            },
+        ]
+    )
+    replies = find_thread_replies(client, "C111", "1.0", "1.2")
+
+    assert [reply["ts"] for reply in replies] == ["1.0", "1.1", "1.2"]
+    assert [call["cursor"] for call in client.calls] == [None, "next"]
+
+    # The same event doesn't fetch the thread again
+    assert find_thread_replies(client, "C111", "1.0", "1.2") == replies
+    assert len(client.calls) == 2
+
+
+def test_find_thread_replies_reuses_the_first_page():
+    first_page = {
+        "messages": [{"ts": "2.0"}, {"ts": "2.1"}],
+        "response_metadata": {"next_cursor": "next"},
+    }
+    client = FakeClient(
+        [
+            {
+                "messages": [{"ts": "2.0"}, {"ts": "2.2"}],
+                "response_metadata": {"next_cursor": ""},
+            },
+        ]
+    )
+    replies = find_thread_replies(client, "C111", "2.0", "2.2", first_page=first_page)
+
+    assert [reply["ts"] for reply in replies] == ["2.0", "2.1", "2.2"]
+    assert [call["cursor"] for call in client.calls] == ["next"]
+
+
+def test_find_dm_history_returns_the_latest_messages_in_order():
+    client = FakeClient([{"messages": [{"ts": "3.2"}, {"ts": "3.1"}]}])
+    messages = find_dm_history(client, "D111", "3.2", oldest="3")
+
+    assert [message["ts"] for message in messages] == ["3.1", "3.2"]
+    # Anchored at the event, so the newest messages are returned
+    assert client.calls[0]["latest"] == "3.2"
+    assert client.calls[0]["inclusive"] is True
+    assert client.calls[0]["oldest"] == "3"
@@ -0,0 +1,50 @@
+from app.ttl_cache import TTLCache
+
+
+def test_get_and_set():
+    cache = TTLCache(maxsize=2, ttl_seconds=60)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    assert cache.get("b") == 2
+
+
+def test_oldest_entry_is_evicted():
+    cache = TTLCache(maxsize=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert cache.get("c") == 3
+
+
+def test_expired_entry_is_not_returned(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr("app.ttl_cache.time.monotonic", lambda: now)
+    cache = TTLCache(maxsize=2, ttl_seconds=5)
+    cache.set("a", 1)
+    now += 4
+    assert cache.get("a") == 1
+    now += 1
+    assert cache.get("a") is None
+
+
+def test_add_only_stores_missing_keys():
+    cache = TTLCache(maxsize=2, ttl_seconds=60)
+    assert cache.add("a", 1) is True
+    assert cache.add("a", 2) is False
+    assert cache.get("a") == 1
+
+
+def test_expired_entries_are_evicted_on_write(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr("app.ttl_cache.time.monotonic", lambda: now)
+    cache = TTLCache(maxsize=1024, ttl_seconds=5)
+    for i in range(2000):
+        cache.set(i, i)
+    now += 5
+    cache.add("a")
+    assert list(cache._entries) == ["a"]